@@ -1,22 +1,193 @@
-import copy
+import math
+import re
+import threading
+from collections import OrderedDict
+from functools import cache
 
 import numpy as np
-from pysgf import SGF, Move, SGFNode
+from pysgf import Move, SGFNode
 
 from shape.utils import setup_logging
 
+try:
+    from numba import njit
+
+    JIT_AVAILABLE = True
+except ImportError:  # numba is optional, the kernels below also run as plain Python
+    JIT_AVAILABLE = False
+
+    def njit(*_args, **_kwargs):
+        return lambda fn: fn
+
+
 logger = setup_logging()
 
+EMPTY, BLACK, WHITE = 0, 1, 2
+STONE_COLORS = {"B": BLACK, "W": WHITE}
+
+SGF_TOKEN_RE = re.compile(r"\s*(?:([();])|([A-Za-z]+)((?:\s*\[(?:[^\]\\]|\\.)*\])+))", re.DOTALL)
+SGF_VALUE_RE = re.compile(r"\[((?:[^\]\\]|\\.)*)\]", re.DOTALL)
+
+
+@cache
+def gtp_coordinates(board_size: tuple[int, int]) -> list[list[str]]:
+    """GTP strings for every point indexed by [col][row], built once per board size."""
+    bx, by = board_size
+    return [[Move(coords=(col, row)).gtp() for row in range(by)] for col in range(bx)]
+
+
+@cache
+def policy_moves(size: int) -> tuple[Move, ...]:
+    """Moves for each point of a policy in KataGo's top row first order, shared between calls so treat as read-only."""
+    return tuple(Move(coords=(col, size - 1 - row)) for row in range(size) for col in range(size))
+
+
+def move_gtp(move: Move, board_size: tuple[int, int]) -> str:
+    if move.is_pass:
+        return "pass"
+    col, row = move.coords
+    return gtp_coordinates(board_size)[col][row]
+
+
+def parse_sgf_main_line(sgf_data: str) -> list[dict[str, list[str]]]:
+    """Scans the properties of each node on the main line in a single pass, stopping at the first closed variation."""
+    nodes = []
+    pos = sgf_data.find("(") + 1
+    while pos and (match := SGF_TOKEN_RE.match(sgf_data, pos)):
+        pos = match.end()
+        if match[1] == ")":
+            break
+        if match[1] == ";":
+            nodes.append({})
+        elif match[2] and nodes:
+            nodes[-1][match[2]] = SGF_VALUE_RE.findall(match[3])
+    return nodes
+
+
+@njit(cache=True, nogil=True)
+def find_chain(chain_links, point):
+    """Returns the union-find root of the chain containing `point`, halving the path on the way."""
+    parent = chain_links[0]
+    while parent[point] != point:
+        parent[point] = parent[parent[point]]
+        point = parent[point]
+    return point
+
+
+@cache
+def neighbour_table(rows: int, cols: int) -> np.ndarray:
+    """Flat indices of the on-board neighbours of every flat point, padded with -1, so kernels skip bounds checks."""
+    table = np.full((rows * cols, 4), -1, dtype=np.int16)
+    for point in range(rows * cols):
+        row, col = divmod(point, cols)
+        neighbours = [
+            nrow * cols + ncol
+            for nrow, ncol in ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1))
+            if 0 <= nrow < rows and 0 <= ncol < cols
+        ]
+        table[point, : len(neighbours)] = neighbours
+    return table
+
+
+@njit(cache=True, nogil=True)
+def remove_chain(board, chain_links, chain_liberties, neighbours, root):
+    """Removes the chain at `root` from the flat board, crediting neighbouring chains with liberties, returns its size."""
+    size, point = 0, root
+    while True:
+        board[point] = EMPTY
+        size += 1
+        point = chain_links[1, point]
+        if point == root:
+            break
+    while True:
+        next_point = chain_links[1, point]
+        for neighbour in neighbours[point]:
+            if neighbour < 0:
+                break
+            if board[neighbour] != EMPTY:
+                chain_liberties[find_chain(chain_links, neighbour)] += 1
+        chain_links[0, point] = point
+        chain_links[1, point] = point
+        point = next_point
+        if point == root:
+            break
+    return size
+
+
+@njit(cache=True, nogil=True)
+def play_stone(board_state, chain_links, chain_liberties, neighbours, row, col, color, opponent):
+    """Places a stone in-place and removes captured chains (or the chain itself on suicide), returns #captured.
+
+    Chains are tracked incrementally: chain_links[0] holds union-find parents, chain_links[1] links the stones of a
+    chain into a cycle, and chain_liberties holds the pseudo-liberty count of each chain root."""
+    rows, cols = board_state.shape
+    board = board_state.reshape(rows * cols)
+    point = row * cols + col
+    board[point] = color
+    chain_links[0, point] = point
+    chain_links[1, point] = point
+    chain_liberties[point] = 0
+    for neighbour in neighbours[point]:
+        if neighbour < 0:
+            break
+        if board[neighbour] == EMPTY:
+            chain_liberties[point] += 1
+        else:
+            chain_liberties[find_chain(chain_links, neighbour)] -= 1
+    for neighbour in neighbours[point]:
+        if neighbour < 0:
+            break
+        if board[neighbour] == color:
+            root, neighbour_root = find_chain(chain_links, point), find_chain(chain_links, neighbour)
+            if root != neighbour_root:
+                chain_links[0, neighbour_root] = root
+                chain_liberties[root] += chain_liberties[neighbour_root]
+                chain_links[1, root], chain_links[1, neighbour_root] = (
+                    chain_links[1, neighbour_root],
+                    chain_links[1, root],
+                )
+    captured = 0
+    for neighbour in neighbours[point]:
+        if neighbour < 0:
+            break
+        if board[neighbour] == opponent:
+            neighbour_root = find_chain(chain_links, neighbour)
+            if chain_liberties[neighbour_root] == 0:
+                captured += remove_chain(board, chain_links, chain_liberties, neighbours, neighbour_root)
+    if captured == 0:
+        root = find_chain(chain_links, point)
+        if chain_liberties[root] == 0:  # allow suicide
+            remove_chain(board, chain_links, chain_liberties, neighbours, root)
+    return captured
+
+
+@njit(cache=True, nogil=True)
+def _mix_policies_jit(policies, ranks):
+    num_policies, num_points = policies.shape
+    mean_prob = np.empty(num_points, dtype=policies.dtype)
+    mean_rank = np.empty(num_points, dtype=policies.dtype)
+    for point in range(num_points):
+        total = weighted = 0.0
+        for i in range(num_policies):
+            total += policies[i, point]
+            weighted += policies[i, point] * ranks[i]
+        mean_prob[point] = total / num_policies
+        mean_rank[point] = weighted / max(total, 1e-10)
+    return mean_prob, mean_rank
+
+
+def mix_policies(policies: np.ndarray, ranks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mean probability and probability-weighted mean rank per point of stacked (num_policies, points) policies."""
+    if JIT_AVAILABLE:  # a single fused pass, the numpy version below makes a few temporaries
+        return _mix_policies_jit(policies, ranks)
+    return policies.mean(axis=0), ranks @ policies / policies.sum(axis=0).clip(min=1e-10)
+
 
 class PolicyData:
-    @staticmethod
-    def grid_from_data(policy_data: list[float] | np.ndarray):
-        size = int(len(policy_data) ** 0.5)
-        return np.reshape(policy_data[:-1], (size, size))[::-1]
-
     def __init__(self, policy_data: list[float] | np.ndarray):
-        self.data = np.array(policy_data)
-        self.grid = self.grid_from_data(self.data)
+        self.data = np.ascontiguousarray(policy_data, dtype=np.float32)  # network output has no fp64 precision
+        self.size = math.isqrt(len(self.data) - 1)
+        self.grid = self.data[:-1].reshape(self.size, self.size)  # view in KataGo order, i.e. top row first
         self.pass_prob = self.data[-1]
         self.max_prob = np.max(self.data)
 
@@ -24,7 +195,8 @@ class PolicyData:
         if move.is_pass:
             return self.pass_prob, self.pass_prob / self.max_prob
         col, row = move.coords
-        return self.grid[row][col], self.grid[row][col] / self.max_prob
+        prob = self.grid[self.size - 1 - row, col]
+        return prob, prob / self.max_prob
 
     def sample(
         self,
@@ -34,75 +206,111 @@ class PolicyData:
         exclude_pass: bool = True,
         secondary_data: np.ndarray | None = None,
     ) -> tuple[list[tuple[Move, float, float]], str]:
-        secondary_data_data = secondary_data if secondary_data is not None else self.grid
-        moves = [
-            (Move(coords=(col, row)), prob, d)
-            for row, (policy_row, secondary_data_row) in enumerate(zip(self.grid, secondary_data_data))
-            for col, (prob, d) in enumerate(zip(policy_row, secondary_data_row))
-            if prob > 0
+        probs = self.data[:-1] if exclude_pass else self.data
+        candidates = np.flatnonzero(probs > 0)
+        if not len(candidates):
+            return [], "all"
+        if 0 < top_k < len(candidates):
+            candidates = candidates[np.argpartition(-probs[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-probs[candidates], kind="stable")]
+        sorted_probs = probs[order]
+
+        stops = {  # move number at which each cutoff triggers, earlier entries take precedence on ties
+            "min_p": np.searchsorted(-sorted_probs, -min_p * sorted_probs[0], side="right") + 1,
+            "top_k": top_k,
+            "top_p": np.searchsorted(np.cumsum(sorted_probs, dtype=np.float64), top_p) + 1,
+        }
+        reason = min(stops, key=stops.get)
+        if stops[reason] > len(order):
+            reason, num_moves = "all", len(order)
+        else:
+            num_moves = stops[reason] - (reason == "min_p")
+
+        kept = order[:num_moves]
+        secondary_data_data = (secondary_data if secondary_data is not None else self.data)[kept]
+        moves = policy_moves(self.size)
+        top_moves = [
+            ("pass", prob, None) if ix == len(moves) else (moves[ix], prob, d)
+            for ix, prob, d in zip(kept.tolist(), sorted_probs[:num_moves], secondary_data_data)
         ]
-        if self.pass_prob > 0 and not exclude_pass:
-            moves.append(("pass", self.pass_prob, None))
-        moves.sort(key=lambda x: x[1], reverse=True)
-        highest_prob = moves[0][1]
-        top_moves = []
-        total_prob = 0
-        for i, (move, prob, *data) in enumerate(moves, 1):
-            if prob < min_p * highest_prob:
-                return top_moves, "min_p"
-            top_moves.append((move, prob, *data))
-            total_prob += prob
-
-            if i == top_k:
-                return top_moves, "top_k"
-            if total_prob >= top_p:
-                return top_moves, "top_p"
-
-        return top_moves, "all"
+        return top_moves, reason
 
 
 class Analysis:
     REQUESTED = object()
+    MOVE_INFO_KEYS = ("move", "winrate", "scoreLead", "visits")  # the rest (pv, ownership, ...) is never read
+
+    __slots__ = ("key", "ai_policy", "human_policy", "_score", "_win_rate", "_visits", "_move_infos")
 
     def __init__(self, key: str | None, data: dict):
         self.key = key
-        self.data = data
-        self.ai_policy = PolicyData(data.pop("policy"))
+        self.ai_policy = PolicyData(data["policy"])
         if "humanPolicy" in data:
-            self.human_policy = PolicyData(data.pop("humanPolicy"))
+            self.human_policy = PolicyData(data["humanPolicy"])
         else:
             assert key is None, f"Expected human policy for key {key}"
             self.human_policy = self.ai_policy
-
-    @property
-    def root_info(self) -> dict:
-        return self.data.get("rootInfo", {})
+        root_info = data.get("rootInfo", {})
+        self._score = root_info.get("scoreLead")
+        self._win_rate = root_info.get("winrate")
+        self._visits = root_info.get("visits", 0)
+        self._move_infos = [
+            {k: move_info[k] for k in self.MOVE_INFO_KEYS if k in move_info} for move_info in data.get("moveInfos", [])
+        ]
 
     def ai_score(self) -> float | None:
-        return self.root_info.get("scoreLead")
+        return self._score
 
     def win_rate(self) -> float | None:
-        return self.root_info.get("winrate")
+        return self._win_rate
 
     def visit_count(self) -> int:
-        return self.root_info.get("visits", 0)
+        return self._visits
 
     def ai_moves(self) -> list:
-        return self.data.get("moveInfos", [])
+        return self._move_infos
 
 
 class GameNode(SGFNode):
+    POSITION_CACHE_SIZE = 64
+    _cached_positions: "OrderedDict[GameNode, None]" = OrderedDict()  # LRU of non-root nodes holding a position
+    _cached_positions_lock = threading.Lock()  # delete_child is also called from the engine thread
+
     def __init__(self, parent: "GameNode | None" = None, properties=None, move=None):
         super().__init__(parent, properties, move)
         if parent:
             assert move is not None
-            self.board_state = self._board_state_after_move(parent.board_state, move)
+            self._position = None  # replayed from the nearest ancestor holding a position when needed
         else:
             bx, by = self.board_size
-            self.board_state: list[list[str | None]] = [[None for _ in range(bx)] for _ in range(by)]
+            self._position = (
+                np.zeros((by, bx), dtype=np.uint8),
+                np.tile(np.arange(bx * by, dtype=np.int16), (2, 1)),  # union-find parent, next stone in chain
+                np.zeros(bx * by, dtype=np.int16),  # pseudo-liberties per chain root
+            )
         self.analyses = {}
         self.ai_move_requested = False  # flag to indicate if ai move was manually requested
         self.autoplay_halted_reason: str | None = None  # flag to indicate if autoplay was automatically halted
+        self._nodes_from_root: list[GameNode] | None = None
+
+    @property
+    def nodes_from_root(self) -> list["GameNode"]:
+        if self._nodes_from_root is None:  # extend the path of the nearest ancestor that already has one cached
+            node, uncached = self, []
+            while node is not None and node._nodes_from_root is None:
+                uncached.append(node)
+                node = node.parent
+            self._nodes_from_root = (node._nodes_from_root if node is not None else []) + uncached[::-1]
+        return self._nodes_from_root
+
+    @property
+    def player(self) -> str:
+        """Follows the node's move, pysgf infers it from B/AB properties which merged placements can carry."""
+        return move.player if (move := self.move) else super().player
+
+    @property
+    def next_player(self) -> str:
+        return "W" if self.player == "B" else "B"
 
     @property
     def square_board_size(self) -> int:
@@ -115,77 +323,60 @@ class GameNode(SGFNode):
 
     def delete_child(self, child: "GameNode"):
         self.children = [c for c in self.children if c is not child]
+        with self._cached_positions_lock:
+            self._cached_positions.pop(child, None)
 
-    def _board_state_after_move(self, board_state: list[list[str | None]], move: Move) -> list[list[str | None]]:
-        new_board_state = copy.deepcopy(board_state)
-        if move.is_pass:
-            return new_board_state
-        col, row = move.coords
-        new_board_state[row][col] = move.player
-        captured = self._remove_captured_stones(new_board_state, col, row, move.opponent)
-        if captured:
-            self._remove_group(new_board_state, captured)
-        else:
-            group = self._get_group(new_board_state, col, row)
-            if not self._group_has_liberties(new_board_state, group):
-                self._remove_group(new_board_state, group)  # allow suicide
-        return new_board_state
+    @classmethod
+    def clear_position_cache(cls):
+        """Drops the cached positions, along with the references they keep to nodes of a discarded game tree."""
+        with cls._cached_positions_lock:
+            for node in cls._cached_positions:
+                node._position = None
+            cls._cached_positions.clear()
+
+    @property
+    def position(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._position is None:
+            node, replay = self, []
+            while node._position is None:
+                replay.append(node)
+                node = node.parent
+            board_state, chain_links, chain_liberties = (array.copy() for array in node._position)
+            neighbours = neighbour_table(*board_state.shape)
+            for node in reversed(replay):
+                if not (move := node.move).is_pass:
+                    col, row = move.coords
+                    color, opponent = STONE_COLORS[move.player], STONE_COLORS[move.opponent]
+                    play_stone(board_state, chain_links, chain_liberties, neighbours, row, col, color, opponent)
+            self._position = position = board_state, chain_links, chain_liberties
+            with self._cached_positions_lock:
+                if len(self._cached_positions) >= self.POSITION_CACHE_SIZE:
+                    evicted, _ = self._cached_positions.popitem(last=False)
+                    evicted._position = None
+                self._cached_positions[self] = None
+            return position
+        with self._cached_positions_lock:
+            if self in self._cached_positions:
+                self._cached_positions.move_to_end(self)
+        return self._position
+
+    @property
+    def board_state(self) -> np.ndarray:
+        return self.position[0]
 
     def _is_valid_move(self, move: Move):
         if move.is_pass:
             return True
         col, row = move.coords
-        if not (0 <= row < len(self.board_state) and 0 <= col < len(self.board_state[0])):
+        rows, cols = self.board_state.shape
+        if not (0 <= row < rows and 0 <= col < cols):
             logger.error("Point is out of bounds")
             return False
-        if self.board_state[row][col] is not None:
+        if self.board_state[row, col] != EMPTY:
             logger.error("Point is already occupied")
             return False
         return True
 
-    def _remove_captured_stones(self, board_state, col, row, opponent):
-        captured = []
-        for dcol, drow in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            ncol, nrow = col + dcol, row + drow
-            if 0 <= nrow < len(board_state) and 0 <= ncol < len(board_state[0]) and board_state[nrow][ncol] == opponent:
-                group = self._get_group(board_state, ncol, nrow)
-                if not self._group_has_liberties(board_state, group):
-                    self._remove_group(board_state, group)
-                    captured.extend(group)
-        return captured
-
-    def _get_group(self, board_state, col, row):
-        color = board_state[row][col]
-        group = set()
-        stack = [(col, row)]
-        while stack:
-            ccol, crow = stack.pop()
-            if (ccol, crow) not in group:
-                group.add((ccol, crow))
-                for dcol, drow in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-                    ncol, nrow = ccol + dcol, crow + drow
-                    if (
-                        0 <= nrow < len(board_state)
-                        and 0 <= ncol < len(board_state[0])
-                        and board_state[nrow][ncol] == color
-                    ):
-                        stack.append((ncol, nrow))
-        return group
-
-    def _has_liberties(self, board_state, col, row):
-        for dcol, drow in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
-            ncol, nrow = col + dcol, row + drow
-            if 0 <= nrow < len(board_state) and 0 <= ncol < len(board_state[0]) and board_state[nrow][ncol] is None:
-                return True
-        return False
-
-    def _remove_group(self, board_state, group):
-        for col, row in group:
-            board_state[row][col] = None
-
-    def _group_has_liberties(self, board_state, group):
-        return any(self._has_liberties(board_state, col, row) for col, row in group)
-
     def store_analysis(self, analysis: dict, key: str | None):
         current_analysis = self.get_analysis(key)
         parsed_analysis = Analysis(key, analysis)
@@ -224,21 +415,42 @@ class GameNode(SGFNode):
         return score_diff if self.player == "W" else -score_diff
 
 
-class ShapeSGF(SGF):
-    _NODE_CLASS = GameNode
-
-
 class GameLogic:
+    __slots__ = ("current_node",)
+
     def __init__(self):
         self.new_game()
+        warm_up_node = self.current_node.play(Move(coords=(0, 0), player="B"))
+        warm_up_node.position  # compile (or load cached) jit kernels
+        self.current_node.delete_child(warm_up_node)
+        mix_policies(np.ones((2, 1), dtype=np.float32), np.zeros(2, dtype=np.float32))
 
     def new_game(self, board_size=19, **rules):
+        GameNode.clear_position_cache()
         self.current_node = GameNode(properties={"RU": "JP", "KM": 6.5, "SZ": board_size, **rules})
 
-    def __getattr__(self, attr):
-        if not hasattr(self.current_node, attr):
-            raise AttributeError(f"'GameLogic' object has no attribute '{attr}'")
-        return getattr(self.current_node, attr)
+    @property
+    def board_state(self) -> np.ndarray:
+        return self.current_node.board_state
+
+    @property
+    def square_board_size(self) -> int:
+        return self.current_node.square_board_size
+
+    @property
+    def move(self) -> Move | None:
+        return self.current_node.move
+
+    @property
+    def player(self) -> str:
+        return self.current_node.player
+
+    @property
+    def next_player(self) -> str:
+        return self.current_node.next_player
+
+    def game_ended(self) -> bool:
+        return self.current_node.game_ended()
 
     def make_move(self, move: Move) -> bool:
         if not self.current_node._is_valid_move(move):
@@ -261,5 +473,32 @@ class GameLogic:
     def export_sgf(self, player_names):
         return self.current_node.root.sgf()
 
-    def import_sgf(self, sgf_data: str):
-        self.current_node = ShapeSGF.parse(sgf_data)
+    def import_sgf(self, sgf_data: str) -> bool:
+        nodes = parse_sgf_main_line(sgf_data)
+        if not nodes:
+            return False
+        GameNode.clear_position_cache()
+        node = GameNode(properties=nodes[0])
+        board_size = node.board_size
+        for properties in nodes[1:]:  # fresh tree, so skip the child lookup in play() and create nodes directly
+            moves = [
+                Move.from_sgf(sgf_coords, board_size, player=player)
+                for player in Move.PLAYERS
+                for sgf_coords in properties.get(player, [])
+            ]
+            for i, move in enumerate(moves):
+                if not node._is_valid_move(move):  # O(1), and the jit kernels do not bounds check
+                    return False
+                node = GameNode(parent=node, move=move)
+                if i == 0:  # comments, markup and other properties stay with the first move of the node
+                    for key, values in properties.items():
+                        if key not in Move.PLAYERS:
+                            node.set_property(key, values)
+            if not moves:  # a child without a move would flip player/next_player, so keep its properties here
+                for key, values in properties.items():
+                    if key == "C" and node.get_property("C"):
+                        node.set_property("C", f"{node.get_property('C')}\n\n{values[0]}")
+                    else:
+                        node.add_list_property(key, values)
+        self.current_node = node
+        return True
@@ -1,15 +1,28 @@
-import copy
 import json
+import logging
 import os
 import queue
+import re
 import subprocess
 import threading
 import traceback
+import weakref
 from collections.abc import Callable
 
-from shape.game_logic import GameNode
+from shape.game_logic import GameNode, move_gtp
 from shape.utils import setup_logging
 
+try:
+    from orjson import dumps as dump_json
+    from orjson import loads as load_json
+except ImportError:  # orjson is optional, the standard library is a slower drop-in
+
+    def dump_json(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    load_json = json.loads
+
+
 logger = setup_logging()
 
 
@@ -23,6 +36,10 @@ class KataGoEngine:
         "nz": "new zealand",
         "stone_scoring": "stone_scoring",
     }
+    REQUIRED_FILES = {"config": "analysis.cfg", "model": "katago-28b.bin.gz", "human_model": "katago-human.bin.gz"}
+    STDERR_NOTEWORTHY_RE = re.compile(rb"error|warning|fatal|exception|ready to begin", re.IGNORECASE)
+    MAX_PENDING_QUERIES = 64  # queries sent to KataGo without a response yet, further ones wait in the queue
+    MAX_QUERY_BATCH = 32  # queries sent to KataGo in one write when they queue up faster than they are sent
 
     def __init__(self, katago_path, model_folder=None):
         if model_folder == None:
@@ -30,31 +47,41 @@ class KataGoEngine:
         else:
             base_dir = os.path.abspath(model_folder)
 
-        config_path = os.path.join(base_dir, "analysis.cfg")
-        model_path = os.path.join(base_dir, "katago-28b.bin.gz")
-        human_model_path = os.path.join(base_dir, "katago-human.bin.gz")
-        if not os.path.exists(config_path) or not os.path.exists(model_path) or not os.path.exists(human_model_path):
-            raise RuntimeError("Models not found. Run install.sh to download the models.")
+        try:  # a single directory read instead of a stat per file
+            with os.scandir(base_dir) as entries:
+                present = {entry.name for entry in entries}
+        except OSError:
+            present = set()
+        if missing := [name for name in self.REQUIRED_FILES.values() if name not in present]:
+            raise RuntimeError(f"Models not found ({', '.join(missing)}). Run install.sh to download the models.")
+        self.paths = {key: os.path.join(base_dir, name) for key, name in self.REQUIRED_FILES.items()}
+        self.katago_path = os.path.abspath(katago_path)
 
         command = [
-            os.path.abspath(katago_path),
+            self.katago_path,
             "analysis",
             "-config",
-            config_path,
+            self.paths["config"],
             "-model",
-            model_path,
+            self.paths["model"],
             "-human-model",
-            human_model_path,
+            self.paths["human_model"],
         ]
         self.query_queue = queue.Queue()
-        self.response_callbacks = {}
+        self.response_callbacks: dict[str, Callable] = {}
+        self.callbacks_lock = threading.Lock()
+        self.query_slots = threading.BoundedSemaphore(self.MAX_PENDING_QUERIES)  # caps response_callbacks
+        self.pending_queries: dict[tuple, list[Callable]] = {}  # query content -> callbacks waiting for its response
+        self.query_payloads = weakref.WeakKeyDictionary()  # node -> (moves, initialStones) in query format
         self.process = self._start_process(command)
         if self.process.poll() is not None:
-            raise RuntimeError(f"KataGo process exited unexpectedly on startup: {self.process.stderr.read()}")
+            raise RuntimeError(
+                f"KataGo process exited unexpectedly on startup: {self.process.stderr.read().decode(errors='replace')}"
+            )
 
         threads = [
-            threading.Thread(target=self._log_stderr, daemon=True),
-            threading.Thread(target=self._process_responses, daemon=True),
+            threading.Thread(target=self._read_pipe, args=(self.process.stdout, self._process_responses), daemon=True),
+            threading.Thread(target=self._read_pipe, args=(self.process.stderr, self._log_stderr), daemon=True),
             threading.Thread(target=self._process_query_queue, daemon=True),
         ]
         for thread in threads:
@@ -69,9 +96,6 @@ class KataGoEngine:
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
             )
         except Exception as e:
             logger.error(f"Failed to start KataGo process: {e}")
@@ -83,76 +107,163 @@ class KataGoEngine:
             self.process.terminate()
             self.process.wait()
 
-    def _process_responses(self):
-        if self.process.stdout:
-            for line in self.process.stdout:
-                try:
-                    response = json.loads(line)
-                    query_id = response.get("id")
-                    if query_id and query_id in self.response_callbacks:
-                        callback = self.response_callbacks.pop(query_id)
-                        self._log_response(response)
-                        logger.debug(f"Calling callback for query_id: {query_id}")
-                        try:
-                            callback(response)
-                        except Exception as e:
-                            logger.error(f"Error calling callback for query_id: {query_id}, error: {e}")
-                            traceback.print_exc()
-                        logger.debug(f"Callback called for query_id: {query_id}")
-                    else:
-                        logger.error(f"Received response with unknown id: {query_id}")
-                except json.JSONDecodeError:
-                    logger.error(f"Failed to parse KataGo response: {line.strip()}")
+    def _read_pipe(self, pipe, handler: Callable[[list[bytes]], None]):
+        """Reads raw bytes from one of KataGo's output pipes in its own thread (select does not support pipes on Windows),
+        splitting them into lines for the handler."""
+        buffer, fd = bytearray(), pipe.fileno()
+        while data := os.read(fd, 1 << 16):  # empty once the process closed the pipe
+            buffer += data
+            *lines, remainder = buffer.split(b"\n")
+            buffer[:] = remainder
+            if lines:
+                handler(lines)
+
+    def _process_responses(self, lines: list[bytes]):
+        for line in lines:
+            self._process_response(line)
+
+    def _process_response(self, line: bytes):
+        try:
+            response = load_json(line)
+        except json.JSONDecodeError:  # also the base class of orjson's decode error
+            logger.error(f"Failed to parse KataGo response: {line.decode(errors='replace').strip()}")
+            return
+        query_id = response.get("id")
+        with self.callbacks_lock:
+            callback = self.response_callbacks.pop(query_id, None)
+        if callback is not None:
+            self.query_slots.release()
+            self._log_response(response)
+            logger.debug("Calling callback for query_id: %s", query_id)
+            try:
+                callback(response)
+            except Exception as e:
+                logger.error(f"Error calling callback for query_id: {query_id}, error: {e}")
+                traceback.print_exc()
+            logger.debug("Callback called for query_id: %s", query_id)
+        else:
+            logger.error(f"Received response with unknown id: {query_id}")
+
+    def _query_payload(self, node: GameNode) -> tuple[list[list[str]], list[list[str]]]:
+        """Moves and initial stones in query format, extending the payload of the nearest ancestor queried before."""
+        if node not in self.query_payloads:
+            ancestor, uncached = node, []
+            while ancestor is not None and ancestor not in self.query_payloads:
+                uncached.append(ancestor)
+                ancestor = ancestor.parent
+            moves, stones = self.query_payloads[ancestor] if ancestor is not None else ([], [])
+            board_size = node.board_size
+            self.query_payloads[node] = (
+                moves + [[m.player, move_gtp(m, board_size)] for n in reversed(uncached) for m in n.moves],
+                stones + [[m.player, move_gtp(m, board_size)] for n in reversed(uncached) for m in n.placements],
+            )
+        return self.query_payloads[node]
 
     def analyze_position(self, node: GameNode, callback: Callable, human_profile_settings: dict, max_visits: int = 100):
-        nodes = node.nodes_from_root
-        moves = [m for node in nodes for m in node.moves]
+        moves, initial_stones = self._query_payload(node)
+        ruleset = node.ruleset.lower()
+        rules = self.RULESETS_ABBR.get(ruleset, ruleset)
+        board_size = node.board_size  # parsed from the root's SZ on every access
+        query_key = (
+            rules,
+            board_size,
+            tuple(map(tuple, moves)),
+            tuple(map(tuple, initial_stones)),
+            tuple(sorted(human_profile_settings.items())),
+            max_visits,
+        )
+        with self.callbacks_lock:  # an identical query still in flight answers this request as well
+            if query_key in self.pending_queries:
+                self.pending_queries[query_key].append(callback)
+                return
+            self.pending_queries[query_key] = [callback]
         self.query_counter += 1
-        query_id = f"{len(nodes)}_{(moves or ['root'])[-1]}_{human_profile_settings.get('humanSLProfile','ai')}_{max_visits}v_{self.query_counter}"
+        last_move = move_gtp(node.move, board_size) if node.move else "root"
+        query_id = f"{node.depth + 1}_{last_move}_{human_profile_settings.get('humanSLProfile', 'ai')}_{max_visits}v_{self.query_counter}"
         query = {
             "id": query_id,
-            "rules": self.RULESETS_ABBR.get(node.ruleset.lower(), node.ruleset.lower()),
-            "boardXSize": node.board_size[0],
-            "boardYSize": node.board_size[1],
-            "moves": [[m.player, m.gtp()] for m in moves],
+            "rules": rules,
+            "boardXSize": board_size[0],
+            "boardYSize": board_size[1],
+            "moves": moves,
             "includePolicy": True,
-            "initialStones": [[m.player, m.gtp()] for node in nodes for m in node.placements],
+            "initialStones": initial_stones,
             "includeOwnership": False,
             "maxVisits": max_visits,
             "overrideSettings": human_profile_settings,
         }
-        self.query_queue.put((query, callback))
+        self.query_queue.put((query, lambda response: self._dispatch_response(query_key, response)))
+
+    def _dispatch_response(self, query_key: tuple, response: dict):
+        with self.callbacks_lock:
+            callbacks = self.pending_queries.pop(query_key)
+        for callback in callbacks:  # one failing callback must not leave the others' nodes waiting forever
+            try:
+                callback(response)
+            except Exception as e:
+                logger.error(f"Error calling callback for query_id: {response.get('id')}, error: {e}")
+                traceback.print_exc()
 
     def _process_query_queue(self):
-        while True:
+        """Sends queued queries to KataGo, draining bursts into a single write and flush."""
+        stopping = False
+        while not stopping:
             query, callback = self.query_queue.get()
             if query is None:
                 break
+            self.query_slots.acquire()  # blocks while KataGo is MAX_PENDING_QUERIES behind
+            batch = [(query, callback)]
+            while len(batch) < self.MAX_QUERY_BATCH and self.query_slots.acquire(blocking=False):
+                try:
+                    item = self.query_queue.get_nowait()
+                except queue.Empty:
+                    item = None
+                if item is None or item[0] is None:
+                    self.query_slots.release()
+                    stopping = item is not None
+                    break
+                batch.append(item)
+            with self.callbacks_lock:  # before writing, as the response can arrive before write returns
+                for query, callback in batch:
+                    self.response_callbacks[query["id"]] = callback
             try:
                 if self.process.stdin:
-                    logger.debug(f"Sending query: {json.dumps(query, indent=2)}")
-                    self.process.stdin.write(json.dumps(query) + "\n")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        for query, _ in batch:
+                            logger.debug(f"Sending query: {json.dumps(query, indent=2)}")
+                    self.process.stdin.write(b"".join(dump_json(query) + b"\n" for query, _ in batch))
                     self.process.stdin.flush()
-                    logger.debug(f"Sent query id {query['id']}")
-                self.response_callbacks[query["id"]] = callback
+                    logger.debug("Sent %d queries", len(batch))
             except Exception as e:
                 logger.error(f"Error sending query: {e}")
-                callback({"error": str(e)})
-            self.query_queue.task_done()
+                with self.callbacks_lock:
+                    for query, _ in batch:
+                        if self.response_callbacks.pop(query["id"], None) is not None:
+                            self.query_slots.release()
+                for _, callback in batch:
+                    callback({"error": str(e)})
+            for _ in batch:
+                self.query_queue.task_done()
 
     def num_outstanding_queries(self):
-        return len(self.response_callbacks)
+        with self.callbacks_lock:
+            return len(self.response_callbacks) + self.query_queue.qsize()
 
-    def _log_stderr(self):
-        if self.process.stderr:
-            for line in self.process.stderr:
-                logger.info(f"[KataGo] {line.strip()}")
+    def _log_stderr(self, lines: list[bytes]):
+        """Logs KataGo's stderr one read at a time, only at info level when something noteworthy is in it."""
+        lines = [line.strip() for line in lines if line.strip()]
+        if any(self.STDERR_NOTEWORTHY_RE.search(line) for line in lines):
+            level = logging.INFO
+        elif logger.isEnabledFor(logging.DEBUG) and lines:
+            level = logging.DEBUG
+        else:
+            return
+        logger.log(level, "[KataGo] " + "\n[KataGo] ".join(line.decode(errors="replace") for line in lines))
 
     def _log_response(self, response):
-        response = copy.deepcopy(response)
-        for k in ["policy", "humanPolicy"]:
-            if k in response:
-                response[k] = f"[{len(response[k])} floats]"
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        response = {k: f"[{len(v)} floats]" if k in ["policy", "humanPolicy"] else v for k, v in response.items()}
         moves = [
             {k: v for k, v in move.items() if k in ["move", "visits", "winrate"]}
             for move in response.get("moveInfos", [])
@@ -1,6 +1,6 @@
 import os
+import shutil
 import signal
-import subprocess
 import sys
 import traceback
 import argparse
@@ -21,11 +21,10 @@ class SHAPEApp:
         self.app = QApplication(sys.argv)
         self.main_window = MainWindow()
 
-        # Use 'which katago' to find the KataGo executable
+        # Look up the KataGo executable on the PATH, without spawning 'which'
         if katago_path == None:
-            try:
-                katago_path = subprocess.check_output(["which", "katago"]).decode().strip()
-            except subprocess.CalledProcessError:
+            katago_path = shutil.which("katago")
+            if katago_path is None:
                 self.show_error("KataGo not found in PATH. Please install KataGo and make sure it's accessible.")
                 sys.exit(1)
 
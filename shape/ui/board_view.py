@@ -1,21 +1,62 @@
+import math
+import os
+from functools import cache
+from typing import NamedTuple
+
 import numpy as np
-from PySide6.QtCore import QPointF, QRectF, QSize, Qt, Signal
+from PySide6.QtCore import QLineF, QPointF, QRect, QRectF, QSize, Qt, Signal
 from PySide6.QtGui import (
     QBrush,
     QColor,
     QFont,
+    QImage,
     QLinearGradient,
     QPainter,
+    QPainterPath,
     QPen,
+    QPixmap,
     QRadialGradient,
+    QStaticText,
+    QSurfaceFormat,
+    QTransform,
 )
 from PySide6.QtWidgets import QSizePolicy, QWidget
 
-from shape.game_logic import GameNode, Move, PolicyData
+from shape.game_logic import BLACK, EMPTY, GameNode, Move, PolicyData, mix_policies
 from shape.utils import setup_logging
 
 logger = setup_logging()
 
+USE_OPENGL = os.environ.get("SHAPE_USE_OPENGL") == "1"  # paint the board through Qt's OpenGL engine
+if USE_OPENGL:
+    from PySide6.QtOpenGLWidgets import QOpenGLWidget as BoardWidget
+else:
+    BoardWidget = QWidget
+
+
+@cache
+def pass_demo_gradient(n: int) -> tuple[np.ndarray, np.ndarray]:
+    """Heatmap shown after passing on the first move: probability rising left to right, rank top to bottom."""
+    prob = np.zeros(n * n + 1, dtype=np.float32)  # pass stays 0
+    rank = np.zeros(n * n + 1, dtype=np.float32)
+    prob[:-1].reshape(n, n)[:] = np.linspace(0.01, 1, n, dtype=np.float32)[None, :]
+    rank[:-1].reshape(n, n)[:] = np.linspace(0, 2, n, dtype=np.float32)[:, None]
+    prob.setflags(write=False)  # shared between calls
+    rank.setflags(write=False)
+    return prob, rank
+
+
+class HeatmapGeometry(NamedTuple):
+    """Everything besides the sampled moves that the cached heatmap image depends on."""
+
+    cell_size: float
+    board_size: int
+    margin_left: float
+    margin_top: float
+    device_pixel_ratio: float
+    logical_dpi_x: int  # label font size depends on the image's dots per meter
+    logical_dpi_y: int
+
 
 def interpolate_color(color1, color2, ratio):
     r = color1.red() + (color2.red() - color1.red()) * ratio
@@ -24,12 +65,13 @@ def interpolate_color(color1, color2, ratio):
     return QColor(int(r), int(g), int(b))
 
 
-class BoardView(QWidget):
+class BoardView(BoardWidget):
     WOOD_COLOR = QColor(220, 179, 92)
     PLAYER_POLICY_COLOR = QColor(20, 200, 20)
     TARGET_POLICY_COLOR = QColor(0, 100, 0)
     AI_POLICY_COLOR = QColor(0, 0, 139)
     OPPONENT_POLICY_COLOR = QColor(139, 0, 0)
+    HEATMAP_COLOR_STEPS = 255  # mean ranks 0..2 are looked up in this many steps rather than interpolated per point
 
     def sizeHint(self):
         return QSize(600, 600)
@@ -39,6 +81,38 @@ class BoardView(QWidget):
         self.main_window = main_window
         self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.setMinimumSize(400, 400)
+        if USE_OPENGL:
+            surface_format = QSurfaceFormat()
+            surface_format.setSamples(4)  # antialiasing is multisampled on the GL paint engine
+            self.setFormat(surface_format)
+        self.last_paint_inputs = None  # paint_inputs() as of the last requested update
+        self.dimensions_key = None  # (width, height, board size) the layout was last calculated for
+        self.background_cache = None  # (size, board size, color and pixel ratio, pixmap)
+        self.heatmap_cache = None  # (node, settings and analyses it was sampled from, sampled moves)
+        self.heatmap_image_cache = None  # (sampled moves, geometry, image, origin)
+        self.heatmap_colors = [
+            self.interpolate_heatmap_color(2 * i / self.HEATMAP_COLOR_STEPS)
+            for i in range(self.HEATMAP_COLOR_STEPS + 1)
+        ]
+        self.heatmap_labels = {}  # (text, point size) -> laid out QStaticText
+        self.stone_pixmaps = {}  # (color, stone size, device pixel ratio) -> pre-rendered stone
+
+    def paint_inputs(self) -> tuple:
+        """Everything drawn on the board besides its geometry, to tell whether a state update changes the picture."""
+        current_node = self.main_window.game_logic.current_node
+        heatmap_policy = self.main_window.control_panel.get_heatmap_settings()["policy"]
+        return (
+            current_node,
+            current_node.autoplay_halted_reason,
+            tuple(heatmap_policy),
+            tuple(self.main_window.config_panel.get_sampling_settings().items()),
+            tuple(current_node.get_analysis(profile) for profile, enabled in heatmap_policy if enabled),
+        )
+
+    def update_if_changed(self):
+        if (paint_inputs := self.paint_inputs()) != self.last_paint_inputs:
+            self.last_paint_inputs = paint_inputs
+            self.update()
 
     def calculate_dimensions(self, board_size):
         self.board_size = board_size
@@ -49,6 +123,9 @@ class BoardView(QWidget):
         self.margin_top = self.cell_size * 0.5
         self.margin_bottom = self.cell_size
         self.stone_size = self.cell_size * 0.95
+        # intersection_coords for all points at once, x by column and y by row
+        self.grid_xs = self.margin_left + np.arange(board_size) * self.cell_size
+        self.grid_ys = self.margin_top + (board_size - 1 - np.arange(board_size)) * self.cell_size
         self.nav_buttons = [
             ("⏮", lambda: self.main_window.on_prev_move(1000), 1.3),
             ("⏪", lambda: self.main_window.on_prev_move(5), 1.3),
@@ -69,6 +146,12 @@ class BoardView(QWidget):
             for i in range(len(self.nav_buttons))
         ]
         self.coord_font_size = max(int(self.cell_size / 3), 8)
+        self.coord_font = QFont("Arial", self.coord_font_size, QFont.Bold)
+        self.nav_fonts = [
+            QFont("Arial", self.coord_font_size * size_adj, QFont.Bold) for _, _, size_adj in self.nav_buttons
+        ]
+        self.heatmap_font = QFont("Arial", int(self.cell_size / 3.5), QFont.Bold)
+        self.status_font = QFont("Arial", int(self.cell_size * 0.4), QFont.Bold)
 
     def intersection_coords(self, col, row) -> QPointF:
         x = self.margin_left + col * self.cell_size
@@ -77,22 +160,47 @@ class BoardView(QWidget):
 
     def paintEvent(self, event):
         board_state = self.main_window.game_logic.board_state
-        self.calculate_dimensions(self.main_window.game_logic.square_board_size)
+        dimensions_key = (self.width(), self.height(), self.main_window.game_logic.square_board_size)
+        if dimensions_key != self.dimensions_key:
+            self.calculate_dimensions(dimensions_key[2])
+            self.dimensions_key = dimensions_key
 
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing, True)
         painter.setRenderHint(QPainter.SmoothPixmapTransform, True)
 
-        self.draw_board(painter)
-        self.draw_coordinates_and_nav(painter)
-        self.draw_star_points(painter)
-
-        heatmap_settings = self.main_window.control_panel.get_heatmap_settings()
-        sampling_settings = self.main_window.config_panel.get_sampling_settings()
-        self.draw_heatmap(painter, heatmap_settings["policy"], sampling_settings)
-
-        self.draw_stones(board_state, painter)
-        self.draw_game_status(painter)
+        painter.drawPixmap(0, 0, self.background_pixmap())
+
+        exposed = self.rect() if USE_OPENGL else event.rect()  # a GL frame is always drawn from scratch
+        padded_grid_size = self.cell_size * (self.board_size + 1)  # stones and heatmap reach half a cell past the grid
+        padded_grid = QRectF(
+            self.margin_left - self.cell_size, self.margin_top - self.cell_size, padded_grid_size, padded_grid_size
+        )
+        if padded_grid.intersects(QRectF(exposed)):
+            heatmap_settings = self.main_window.control_panel.get_heatmap_settings()
+            sampling_settings = self.main_window.config_panel.get_sampling_settings()
+            self.draw_heatmap(painter, heatmap_settings["policy"], sampling_settings)
+            self.draw_stones(board_state, painter, exposed)
+
+        if exposed.top() < self.margin_top:  # status text lives above the grid
+            self.draw_game_status(painter)
+
+    def background_pixmap(self) -> QPixmap:
+        """Board, grid, coordinates and buttons, rendered again only when the size or board color changes."""
+        dpr = self.devicePixelRatioF()
+        halted = bool(self.main_window.game_logic.current_node.autoplay_halted_reason)
+        key = (self.width(), self.height(), self.board_size, halted, dpr)
+        if self.background_cache is None or self.background_cache[0] != key:
+            pixmap = QPixmap(math.ceil(self.width() * dpr), math.ceil(self.height() * dpr))
+            pixmap.setDevicePixelRatio(dpr)
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            self.draw_board(painter)
+            self.draw_coordinates_and_nav(painter)
+            self.draw_star_points(painter)
+            painter.end()
+            self.background_cache = (key, pixmap)
+        return self.background_cache[1]
 
     def draw_board(self, painter):
         if self.main_window.game_logic.current_node.autoplay_halted_reason:
@@ -101,24 +209,35 @@ class BoardView(QWidget):
             color = self.WOOD_COLOR
         painter.fillRect(self.rect(), color)
         painter.setPen(QPen(QColor(0, 0, 0, 180), 1))
-        for i in range(self.board_size):
-            painter.drawLine(self.intersection_coords(0, i), self.intersection_coords(self.board_size - 1, i))
-            painter.drawLine(self.intersection_coords(i, 0), self.intersection_coords(i, self.board_size - 1))
+        xs, ys = self.grid_xs.tolist(), self.grid_ys.tolist()
+        left, right, top, bottom = xs[0], xs[-1], ys[-1], ys[0]
+        painter.drawLines([QLineF(left, y, right, y) for y in ys] + [QLineF(x, top, x, bottom) for x in xs])
         painter.setPen(QPen(QColor(0, 0, 0), 2))
         grid_size = self.cell_size * (self.board_size - 1)
         painter.drawRect(QRectF(self.margin_left, self.margin_top, grid_size, grid_size))
 
     def draw_star_points(self, painter):
-        painter.setBrush(QBrush(Qt.black))
+        star_points = QPainterPath()
         for col, row in self.get_star_points():
-            painter.drawEllipse(self.intersection_coords(col, row), 3, 3)
+            star_points.addEllipse(self.intersection_coords(col, row), 3, 3)
+        painter.setBrush(QBrush(Qt.black))
+        painter.drawPath(star_points)
 
-    def draw_stones(self, board_state, painter):
+    def draw_stones(self, board_state, painter, exposed: QRect):
         game_logic = self.main_window.game_logic
-        for row in range(self.board_size):
-            for col in range(self.board_size):
-                if board_state[row][col] is not None:
-                    self.draw_stone(painter, row, col, board_state[row][col])
+        # only visit intersections whose stones overlap the exposed part of the widget
+        col_from = max(0, math.floor((exposed.left() - self.margin_left) / self.cell_size - 0.5))
+        col_to = min(self.board_size, math.ceil((exposed.right() - self.margin_left) / self.cell_size + 0.5) + 1)
+        row_from = max(0, math.floor(self.board_size - 1 - (exposed.bottom() - self.margin_top) / self.cell_size - 0.5))
+        row_to = min(
+            self.board_size,
+            math.ceil(self.board_size - 1 - (exposed.top() - self.margin_top) / self.cell_size + 0.5) + 1,
+        )
+        window = board_state[row_from:row_to, col_from:col_to]
+        rows, cols = np.nonzero(window != EMPTY)
+        xs, ys = self.grid_xs[cols + col_from], self.grid_ys[rows + row_from]
+        for x, y, color in zip(xs.tolist(), ys.tolist(), window[rows, cols].tolist()):
+            self.draw_stone(painter, x, y, color)
 
         last_move = game_logic.move
         if last_move and not last_move.is_pass:
@@ -128,26 +247,46 @@ class BoardView(QWidget):
             painter.setBrush(Qt.NoBrush)
             painter.drawEllipse(center, self.stone_size / 4, self.stone_size / 4)
 
-    def draw_stone(self, painter, row, col, color):
-        center = self.intersection_coords(col, row)
-
-        gradient = QRadialGradient(center.x() - self.stone_size / 4, center.y() - self.stone_size / 4, self.stone_size)
-        if color == "B":
-            gradient.setColorAt(0, QColor(80, 80, 80))
-            gradient.setColorAt(0.5, Qt.black)
-            gradient.setColorAt(1, QColor(10, 10, 10))
-        else:
-            gradient.setColorAt(0, QColor(230, 230, 230))
-            gradient.setColorAt(0.5, Qt.white)
-            gradient.setColorAt(1, QColor(200, 200, 200))
-
-        painter.setBrush(QBrush(gradient))
-        painter.setPen(Qt.NoPen)
-        painter.drawEllipse(center, self.stone_size / 2, self.stone_size / 2)
+    def draw_stone(self, painter, x, y, color):
+        pixmap, side = self.stone_pixmap(color)
+        painter.drawPixmap(QPointF(x - side / 2, y - side / 2), pixmap)
+
+    def stone_pixmap(self, color) -> tuple[QPixmap, int]:
+        """Stone rendered once per color and size, so repaints blit it instead of filling a gradient per stone."""
+        dpr = self.devicePixelRatioF()
+        key = (color, self.stone_size, dpr)
+        if key not in self.stone_pixmaps:
+            if len(self.stone_pixmaps) >= 2:  # stones of a previous size are no longer needed
+                self.stone_pixmaps.clear()
+            side = math.ceil(self.stone_size) + 2  # margin for the antialiased edge
+            pixmap = QPixmap(math.ceil(side * dpr), math.ceil(side * dpr))
+            pixmap.setDevicePixelRatio(dpr)
+            pixmap.fill(Qt.transparent)
+            center = QPointF(side / 2, side / 2)
+
+            gradient = QRadialGradient(
+                center.x() - self.stone_size / 4, center.y() - self.stone_size / 4, self.stone_size
+            )
+            if color == BLACK:
+                gradient.setColorAt(0, QColor(80, 80, 80))
+                gradient.setColorAt(0.5, Qt.black)
+                gradient.setColorAt(1, QColor(10, 10, 10))
+            else:
+                gradient.setColorAt(0, QColor(230, 230, 230))
+                gradient.setColorAt(0.5, Qt.white)
+                gradient.setColorAt(1, QColor(200, 200, 200))
+
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            painter.setBrush(QBrush(gradient))
+            painter.setPen(Qt.NoPen)
+            painter.drawEllipse(center, self.stone_size / 2, self.stone_size / 2)
+            painter.end()
+            self.stone_pixmaps[key] = (pixmap, side)
+        return self.stone_pixmaps[key]
 
     def draw_coordinates_and_nav(self, painter):
-        font = QFont("Arial", self.coord_font_size, QFont.Bold)
-        painter.setFont(font)
+        painter.setFont(self.coord_font)
         painter.setPen(QColor(0, 0, 0))
         for i in range(self.board_size):
             bottom_box = self.intersection_coords(i - 0.5, -0.5)
@@ -162,8 +301,8 @@ class BoardView(QWidget):
                 Qt.AlignVCenter | Qt.AlignRight,
                 str(i + 1),
             )
-        for (text, _, size_adj), nav_rect in zip(self.nav_buttons, self.nav_rects):
-            painter.setFont(QFont("Arial", self.coord_font_size * size_adj, QFont.Bold))
+        for (text, _, _), nav_rect, font in zip(self.nav_buttons, self.nav_rects, self.nav_fonts):
+            painter.setFont(font)
             painter.drawText(nav_rect, Qt.AlignCenter, text)
 
     def mousePressEvent(self, event):
@@ -185,84 +324,143 @@ class BoardView(QWidget):
         return star_points.get(self.board_size, [])
 
     def get_weighted_policy_data(self, human_profiles: list[str]) -> tuple[np.ndarray | None, np.ndarray]:
-        game_logic = self.main_window.game_logic
-        heatmap_mean_prob = None
-        heatmap_mean_rank = np.array([])  # make type hints happy
-        num_enabled = 0
-
+        current_node = self.main_window.game_logic.current_node
+        ranks, policies = [], []
         for i, (profile, enabled) in enumerate(human_profiles):
-            if not (analysis := game_logic.current_node.get_analysis(profile)):
-                continue
-            policy = np.array(analysis.human_policy.data)
-            if enabled:
-                num_enabled += 1
-                if heatmap_mean_prob is None:
-                    heatmap_mean_prob = np.zeros_like(policy)
-                    heatmap_mean_rank = np.zeros_like(policy)
-                heatmap_mean_prob += policy
-                heatmap_mean_rank += policy * i
-        if heatmap_mean_prob is not None:
-            heatmap_mean_rank /= heatmap_mean_prob.clip(min=1e-10)
-            heatmap_mean_prob /= num_enabled
+            if enabled and (analysis := current_node.get_analysis(profile)):
+                ranks.append(i)
+                policies.append(analysis.human_policy.data)
+        if not policies:
+            return None, np.array([])  # make type hints happy
+        if len(policies) == 1:  # no mixing needed, the rank is the same everywhere
+            return policies[0], np.full_like(policies[0], ranks[0])
 
-        return heatmap_mean_prob, heatmap_mean_rank
+        policies = np.stack(policies)
+        return mix_policies(policies, np.array(ranks, dtype=policies.dtype))
 
     def draw_heatmap(self, painter, policy, sampling_settings):
-        heatmap_mean_prob, heatmap_mean_rank = self.get_weighted_policy_data(policy)
+        if top_moves := self.get_heatmap_moves(policy, sampling_settings):
+            image, origin = self.heatmap_image(top_moves)
+            painter.drawImage(origin, image)
+
+    def heatmap_image(self, top_moves) -> tuple[QImage, QPointF]:
+        """Heatmap layer painted once per sample and board geometry, so repaints draw a single image."""
+        geometry = HeatmapGeometry(
+            self.cell_size,
+            self.board_size,
+            self.margin_left,
+            self.margin_top,
+            self.devicePixelRatioF(),
+            self.logicalDpiX(),
+            self.logicalDpiY(),
+        )
         if (
-            self.main_window.game_logic.move
-            and self.main_window.game_logic.move.is_pass
-            and self.main_window.game_logic.current_node.parent.parent is None
+            self.heatmap_image_cache
+            and self.heatmap_image_cache[0] is top_moves
+            and self.heatmap_image_cache[1] == geometry
         ):
-            prob_gradient = np.tile(np.linspace(0.01, 1, self.board_size), (self.board_size, 1))
-            rank_gradient = np.tile(np.linspace(0, 2, self.board_size), (self.board_size, 1)).T
-            heatmap_mean_prob = np.append(prob_gradient.ravel(), 0)
-            heatmap_mean_rank = np.append(rank_gradient.ravel(), 0)
+            return self.heatmap_image_cache[2:]
+
+        origin = QPointF(self.margin_left - self.cell_size, self.margin_top - self.cell_size)  # one cell of padding
+        side = self.cell_size * (self.board_size + 1)
+        dpr = geometry.device_pixel_ratio
+        image = QImage(math.ceil(side * dpr), math.ceil(side * dpr), QImage.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(dpr)
+        image.setDotsPerMeterX(
+            round(geometry.logical_dpi_x / 0.0254)
+        )  # point-size fonts as they would be on the widget
+        image.setDotsPerMeterY(round(geometry.logical_dpi_y / 0.0254))
+        image.fill(Qt.transparent)
+        image_painter = QPainter(image)
+        image_painter.setRenderHint(QPainter.Antialiasing, True)
+        image_painter.translate(-origin.x(), -origin.y())
+        self.draw_heatmap_points(image_painter, top_moves)
+        image_painter.end()
+
+        self.heatmap_image_cache = (top_moves, geometry, image, origin)
+        return image, origin
+
+    def get_heatmap_moves(self, policy, sampling_settings) -> list:
+        """Samples the heatmap moves, cached until the node, its analyses or the settings change."""
+        current_node = self.main_window.game_logic.current_node
+        key = (
+            current_node,
+            tuple(policy),
+            tuple(sampling_settings.items()),
+            tuple(current_node.get_analysis(profile) for profile, enabled in policy if enabled),
+        )
+        if self.heatmap_cache is not None and self.heatmap_cache[0] == key:
+            return self.heatmap_cache[1]
+
+        if current_node.move and current_node.move.is_pass and current_node.parent.parent is None:
+            heatmap_mean_prob, heatmap_mean_rank = pass_demo_gradient(self.board_size)
             sampling_settings = dict(min_p=0)
+        else:
+            heatmap_mean_prob, heatmap_mean_rank = self.get_weighted_policy_data(policy)
 
+        top_moves = []
         if heatmap_mean_prob is not None:
-            top_moves, _ = PolicyData(heatmap_mean_prob).sample(
-                secondary_data=PolicyData.grid_from_data(heatmap_mean_rank), **sampling_settings
-            )
-            self.draw_heatmap_points(painter, top_moves)
+            top_moves, _ = PolicyData(heatmap_mean_prob).sample(secondary_data=heatmap_mean_rank, **sampling_settings)
+        self.heatmap_cache = (key, top_moves)
+        return top_moves
 
     def draw_heatmap_points(self, painter, top_moves, show_text=True):
         max_prob = top_moves[0][1]
+        squares = {}  # id of color -> (color, squares in that color), so each color is set and drawn once
+        labels = []
         for move, prob, rank in top_moves:
-            color = self.get_heatmap_color(rank)
             rel_prob = prob / max_prob
             size = 0.25 + 0.725 * rel_prob
             center = self.intersection_coords(*move.coords)
             x = center.x() - size / 2
             y = center.y() - size / 2
 
-            text = "" if rel_prob < 0.01 else f"{prob*100:.0f}"
-
-            painter.setBrush(QBrush(color))
-            painter.setPen(QPen(Qt.black))
+            color = self.get_heatmap_color(rank)
             square_size = self.cell_size * size
-            painter.drawRect(QRectF(x - square_size / 2, y - square_size / 2, square_size, square_size))
-
-            if show_text:
-                font = QFont("Arial", int(self.cell_size / 3.5))
-                font.setBold(True)
-                painter.setFont(font)
-                painter.setPen(QColor(200, 200, 200))
-                painter.drawText(
-                    QRectF(x - self.cell_size / 2, y - self.cell_size / 2, self.cell_size, self.cell_size),
-                    Qt.AlignCenter,
-                    text,
-                )
+            side = round(square_size)  # whole pixels, so the squares fill without antialiased edges
+            square = QRect(round(x - side / 2), round(y - side / 2), side, side)
+            squares.setdefault(id(color), (color, []))[1].append(square)
+            if rel_prob >= 0.01:
+                labels.append((x, y, f"{prob*100:.0f}"))
+
+        painter.setPen(QPen(Qt.black))
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for color, rects in squares.values():
+            painter.setBrush(color)
+            painter.drawRects(rects)
+        painter.setRenderHint(QPainter.Antialiasing, True)
+
+        if show_text:  # all labels after the squares, so font and pen are set once
+            painter.setFont(self.heatmap_font)
+            painter.setPen(QColor(200, 200, 200))
+            for x, y, text in labels:
+                label = self.heatmap_label(text, self.heatmap_font)
+                label_size = label.size()
+                painter.drawStaticText(QPointF(x - label_size.width() / 2, y - label_size.height() / 2), label)
+
+    def heatmap_label(self, text: str, font: QFont) -> QStaticText:
+        """Laid out label text, reused across heatmaps drawn with the same font size."""
+        key = (text, font.pointSize())
+        if key not in self.heatmap_labels:
+            if len(self.heatmap_labels) > 256:  # labels of a previous size
+                self.heatmap_labels.clear()
+            label = QStaticText(text)
+            label.prepare(QTransform(), font)
+            self.heatmap_labels[key] = label
+        return self.heatmap_labels[key]
 
     def get_heatmap_color(self, mean_rank):
+        if mean_rank > 2:
+            return self.OPPONENT_POLICY_COLOR
+        return self.heatmap_colors[round(max(mean_rank, 0) * self.HEATMAP_COLOR_STEPS / 2)]
+
+    def interpolate_heatmap_color(self, mean_rank):
         if mean_rank < 1:  # Interpolate between Light Green and Dark Green
             ratio = mean_rank / 1
             return interpolate_color(self.PLAYER_POLICY_COLOR, self.TARGET_POLICY_COLOR, ratio)
-        elif mean_rank <= 2:  # Interpolate between Dark Green and Dark Blue
+        else:  # Interpolate between Dark Green and Dark Blue
             ratio = min(1, (mean_rank - 1) / 1)
             return interpolate_color(self.TARGET_POLICY_COLOR, self.AI_POLICY_COLOR, ratio)
-        else:
-            return self.OPPONENT_POLICY_COLOR
 
     def draw_game_status(self, painter):
         game_logic = self.main_window.game_logic
@@ -273,9 +471,7 @@ class BoardView(QWidget):
             message = "Pass"
 
         if message:
-            font = QFont("Arial", int(self.cell_size * 0.4))
-            font.setBold(True)
-            painter.setFont(font)
+            painter.setFont(self.status_font)
             painter.setPen(QColor(0, 0, 0))
             text_rect = QRectF(0, 0, self.width(), self.margin_top)
             painter.drawText(text_rect, Qt.AlignCenter, message)
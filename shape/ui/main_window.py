@@ -1,4 +1,5 @@
 import logging
+import threading
 
 import numpy as np
 from PySide6.QtCore import QEvent, Qt, QTimer, Signal
@@ -27,15 +28,23 @@ from shape.utils import setup_logging
 
 logger = setup_logging()
 
+# parts of the UI to refresh in the next _update_state
+DIRTY_BOARD = 1
+DIRTY_ANALYSIS = 2
+DIRTY_CONTROL = 4
+DIRTY_CONFIG = 8
+DIRTY_ALL = DIRTY_BOARD | DIRTY_ANALYSIS | DIRTY_CONTROL | DIRTY_CONFIG
+
 
 class MainWindow(QMainWindow):
-    update_state_main_thread = Signal()
+    update_state_main_thread = Signal(int)
 
     def __init__(self):
         super().__init__()
         self.setStyleSheet(MAIN_STYLESHEET)
         self.katago_engine = None
         self.game_logic = GameLogic()
+        self.rng = np.random.default_rng()
         self.setWindowTitle("SHAPE - Play Go with AI Feedback")
         self.setFocusPolicy(Qt.StrongFocus)
         self.setup_ui()
@@ -44,6 +53,9 @@ class MainWindow(QMainWindow):
         self.update_state_timer = QTimer(self)
         self.update_state_timer.setSingleShot(True)
         self.update_state_timer.timeout.connect(self._update_state)
+        self.main_thread_update_pending = False  # set by the engine thread, cleared in _update_state
+        self.main_thread_update_lock = threading.Lock()
+        self.dirty = 0
 
     def set_engine(self, katago_engine):
         self.katago_engine = katago_engine
@@ -55,14 +67,18 @@ class MainWindow(QMainWindow):
 
     def connect_signals(self):
         self.control_panel.ai_move_button.clicked.connect(self.request_ai_move)
-        self.config_panel.settings_updated.connect(self.update_state)
-        self.control_panel.settings_updated.connect(self.update_state)
+        self.config_panel.settings_updated.connect(lambda: self.update_state(DIRTY_CONFIG | DIRTY_BOARD))
+        self.control_panel.settings_updated.connect(lambda: self.update_state(DIRTY_CONTROL | DIRTY_BOARD))
         self.update_state_main_thread.connect(self.update_state)
 
-    def update_state(self):
+    def update_state(self, flags: int = DIRTY_ALL):
+        self.dirty |= flags
         self.update_state_timer.start(100)  # 100ms debounce
 
     def _update_state(self):
+        with self.main_thread_update_lock:
+            self.main_thread_update_pending = False
+        flags, self.dirty = self.dirty, 0
         current_node = self.game_logic.current_node
         human_profiles, current_analysis = self.ensure_analysis_requested(current_node)
         next_player_human = self.control_panel.get_player_color() == self.game_logic.next_player
@@ -74,13 +90,27 @@ class MainWindow(QMainWindow):
                 )
             ):
                 current_node.autoplay_halted_reason = should_halt_reason
+                flags |= DIRTY_CONTROL
                 logger.info(f"Halting auto-play due to {should_halt_reason}.")
             else:
                 self.maybe_make_ai_move(current_node, human_profiles, current_analysis, next_player_human)
 
-        for tab in [self.control_panel, self.analysis_panel, self.config_panel]:
-            tab.update_ui()
-        self.board_view.update()
+        if self.isMinimized():  # refreshed when restored, see changeEvent
+            return
+        for tab, flag in [
+            (self.control_panel, DIRTY_CONTROL),
+            (self.analysis_panel, DIRTY_ANALYSIS),
+            (self.config_panel, DIRTY_CONFIG),
+        ]:
+            if flags & flag and tab.parentWidget().isVisible():  # others are refreshed when their tab is selected
+                tab.update_ui()
+        if flags & DIRTY_BOARD and self.board_view.isVisible():
+            self.board_view.update_if_changed()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange and not self.isMinimized():
+            self.update_state()
 
     def maybe_make_ai_move(self, current_node, human_profiles, current_analysis, next_player_human):
         if (
@@ -97,7 +127,9 @@ class MainWindow(QMainWindow):
                     self.make_move(None)
                 else:
                     moves, probs, _ = zip(*policy_moves)
-                    move = np.random.choice(moves, p=np.array(probs) / sum(probs))
+                    cumulative = np.cumsum(probs, dtype=np.float64)  # inverse-CDF sample, no normalization needed
+                    ix = np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side="right")
+                    move = moves[min(ix, len(moves) - 1)]
                     logger.info(f"Making sampled move: {move} from {len(policy_moves)} cuttoff due to {reason}")
                     self.make_move(move.coords)
             else:
@@ -160,14 +192,15 @@ class MainWindow(QMainWindow):
         if self.game_logic.import_sgf(sgf_data):
             self.update_state()
             self.update_status_bar("SGF imported successfully.")
-            for node in self.game_logic.current_node.node_history:
-                self.ensure_analysis_requested(node)
+            human_profiles = self.control_panel.get_human_profiles()
+            for node in self.game_logic.current_node.nodes_from_root:
+                self.ensure_analysis_requested(node, human_profiles)
         else:
             self.update_status_bar("Failed to import SGF.")
 
     # analysis
-    def ensure_analysis_requested(self, node):
-        human_profiles = self.control_panel.get_human_profiles()
+    def ensure_analysis_requested(self, node, human_profiles=None):
+        human_profiles = human_profiles or self.control_panel.get_human_profiles()
         current_analysis = {
             k: node.get_analysis(k)
             for k in [None, human_profiles["player"], human_profiles["opponent"], human_profiles["target"]]
@@ -181,7 +214,7 @@ class MainWindow(QMainWindow):
         if node.analysis_requested(human_profile) and not force_visits:
             return
 
-        logger.debug(f"Requesting analysis for {human_profile=} for {node=}")
+        logger.debug("Requesting analysis for human_profile=%r for node=%r", human_profile, node)
 
         if human_profile:
             human_profile_settings = {
@@ -223,8 +256,12 @@ class MainWindow(QMainWindow):
             else f"{human_profile or 'AI'} analysis for {node.move.gtp() if node.move else 'root'} received, still working on {num_queries} queries"
         )
 
-        if node == self.game_logic.current_node:  # update state in main thread
-            self.update_state_main_thread.emit()
+        if node == self.game_logic.current_node:  # update state in main thread, once per burst of responses
+            with self.main_thread_update_lock:
+                if self.main_thread_update_pending:
+                    return
+                self.main_thread_update_pending = True
+            self.update_state_main_thread.emit(DIRTY_BOARD | DIRTY_ANALYSIS | DIRTY_CONTROL)
 
     # UI setup
 
@@ -274,6 +311,7 @@ class MainWindow(QMainWindow):
         self.config_panel = ConfigPanel(self)
         settings_tab.setLayout(self.config_panel)
         tab_widget.addTab(settings_tab, "Settings")
+        tab_widget.currentChanged.connect(lambda _: self.update_state())
         return tab_widget
 
     def create_status_bar(self):
@@ -0,0 +1,23 @@
+import threading
+
+from shape.katago.engine import KataGoEngine
+
+
+def engine_without_process():
+    engine = KataGoEngine.__new__(KataGoEngine)  # skips starting KataGo, only the query bookkeeping is needed
+    engine.callbacks_lock = threading.Lock()
+    engine.pending_queries = {}
+    return engine
+
+
+def test_coalesced_callbacks_survive_a_failing_callback():
+    engine = engine_without_process()
+    received = []
+
+    def failing(response):
+        raise ValueError("callback error")
+
+    engine.pending_queries["query"] = [failing, received.append]
+    engine._dispatch_response("query", {"id": "1"})
+    assert received == [{"id": "1"}]
+    assert not engine.pending_queries
@@ -0,0 +1,176 @@
+import random
+
+import numpy as np
+import pytest
+
+from shape.game_logic import BLACK, EMPTY, WHITE, GameLogic, GameNode, Move, PolicyData
+
+
+@pytest.fixture
+def game():
+    game = GameLogic()
+    game.new_game(9)
+    return game
+
+
+def play(game, *moves):
+    for player, coords in moves:
+        assert game.make_move(Move(coords=coords, player=player)), (player, coords)
+
+
+def reference_play(board, col, row, color):
+    """Straightforward flood-fill capture logic the kernels are checked against, suicide removes the own chain."""
+    board = board.copy()
+    rows, cols = board.shape
+    board[row, col] = color
+
+    def chain_and_liberties(r, c):
+        chain, liberties, stack = set(), False, [(r, c)]
+        while stack:
+            r, c = stack.pop()
+            if (r, c) in chain:
+                continue
+            chain.add((r, c))
+            for nr, nc in ((r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)):
+                if 0 <= nr < rows and 0 <= nc < cols:
+                    if board[nr, nc] == EMPTY:
+                        liberties = True
+                    elif board[nr, nc] == board[r, c]:
+                        stack.append((nr, nc))
+        return chain, liberties
+
+    captured = False
+    for nr, nc in ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1)):
+        if 0 <= nr < rows and 0 <= nc < cols and board[nr, nc] not in (EMPTY, color):
+            chain, liberties = chain_and_liberties(nr, nc)
+            if not liberties:
+                captured = True
+                for r, c in chain:
+                    board[r, c] = EMPTY
+    if not captured:
+        chain, liberties = chain_and_liberties(row, col)
+        if not liberties:
+            for r, c in chain:
+                board[r, c] = EMPTY
+    return board
+
+
+def test_single_stone_capture(game):
+    play(game, ("B", (1, 0)), ("W", (1, 1)), ("B", (0, 1)), ("W", (8, 8)), ("B", (2, 1)), ("W", (8, 7)), ("B", (1, 2)))
+    assert game.board_state[1, 1] == EMPTY
+    assert game.board_state[0, 1] == BLACK and game.board_state[8, 8] == WHITE
+
+
+def test_multi_stone_capture(game):
+    play(game, ("W", (0, 0)), ("B", (0, 1)), ("W", (1, 0)), ("B", (1, 1)), ("W", (5, 5)), ("B", (2, 0)))
+    assert game.board_state[0, 0] == EMPTY and game.board_state[0, 1] == EMPTY
+    assert game.board_state[5, 5] == WHITE
+    game.undo_move()
+    assert game.board_state[0, 0] == WHITE and game.board_state[0, 1] == WHITE
+
+
+def test_single_stone_suicide(game):
+    play(game, ("B", (1, 0)), ("W", (8, 8)), ("B", (0, 1)), ("W", (0, 0)))
+    assert game.board_state[0, 0] == EMPTY
+    assert game.board_state[0, 1] == BLACK and game.board_state[1, 0] == BLACK
+
+
+def test_multi_stone_suicide(game):
+    play(game, ("B", (2, 0)), ("W", (0, 0)), ("B", (0, 1)), ("W", (8, 8)), ("B", (1, 1)), ("W", (1, 0)))
+    assert game.board_state[0, 0] == EMPTY and game.board_state[0, 1] == EMPTY
+    assert (game.board_state == BLACK).sum() == 3
+
+
+def test_capture_takes_precedence_over_suicide(game):
+    # ko shape: black takes the single white stone, white's retake captures the single black stone back
+    play(game, ("B", (1, 0)), ("W", (2, 0)), ("B", (0, 1)), ("W", (3, 1)), ("B", (1, 2)), ("W", (2, 2)))
+    play(game, ("B", (8, 8)), ("W", (1, 1)), ("B", (2, 1)))
+    assert game.board_state[1, 1] == EMPTY and game.board_state[1, 2] == BLACK
+    play(game, ("W", (1, 1)))
+    assert game.board_state[1, 1] == WHITE and game.board_state[1, 2] == EMPTY
+
+
+@pytest.mark.parametrize("size", [5, 9, 19])
+def test_random_games_match_reference(size):
+    game = GameLogic()
+    rng = random.Random(size)
+    for _ in range(3):
+        game.new_game(size)
+        board = np.zeros((size, size), dtype=np.uint8)
+        for i in range(size * size * 2):
+            empties = list(zip(*np.nonzero(board == EMPTY)))
+            row, col = map(int, rng.choice(empties))
+            player = "BW"[i % 2]
+            play(game, (player, (col, row)))
+            board = reference_play(board, col, row, BLACK if player == "B" else WHITE)
+            assert (game.board_state == board).all()
+
+
+def test_evicted_positions_are_replayed():
+    game = GameLogic()
+    game.new_game(19)
+    rng = random.Random(5)
+    snapshots = []
+    for i in range(3 * GameNode.POSITION_CACHE_SIZE):
+        empties = list(zip(*np.nonzero(game.board_state == EMPTY)))
+        row, col = map(int, rng.choice(empties))
+        play(game, ("BW"[i % 2], (col, row)))
+        snapshots.append(game.board_state.copy())
+    assert len(GameNode._cached_positions) <= GameNode.POSITION_CACHE_SIZE
+    for snapshot in reversed(snapshots):
+        assert (game.board_state == snapshot).all()
+        game.undo_move()
+    for snapshot in snapshots:
+        game.redo_move()
+        assert (game.board_state == snapshot).all()
+
+
+@pytest.fixture
+def policy():
+    # 2x2 board in KataGo order (top row first) followed by pass
+    return PolicyData([0.4, 0.3, 0.2, 0.05, 0.05])
+
+
+def sampled(policy, **kwargs):
+    moves, reason = policy.sample(**kwargs)
+    return [move if isinstance(move, str) else move.coords for move, _, _ in moves], reason
+
+
+def test_sample_without_cutoffs(policy):
+    assert sampled(policy) == ([(0, 1), (1, 1), (0, 0), (1, 0)], "all")
+
+
+def test_sample_cutoffs(policy):
+    assert sampled(policy, top_k=2) == ([(0, 1), (1, 1)], "top_k")
+    assert sampled(policy, top_p=0.65) == ([(0, 1), (1, 1)], "top_p")
+    assert sampled(policy, min_p=0.6) == ([(0, 1), (1, 1)], "min_p")
+
+
+def test_sample_cutoff_precedence(policy):
+    # min_p stops before adding the third move, top_k only after adding it
+    assert sampled(policy, top_k=3, min_p=0.6) == ([(0, 1), (1, 1)], "min_p")
+    assert sampled(policy, top_k=2, min_p=0.6)[1] == "top_k"
+    assert sampled(policy, top_k=2, top_p=0.65)[1] == "top_k"
+    assert sampled(policy, top_k=3, top_p=0.65) == ([(0, 1), (1, 1)], "top_p")
+
+
+def test_sample_including_pass(policy):
+    moves, reason = sampled(policy, exclude_pass=False)
+    assert reason == "all" and len(moves) == 5 and "pass" in moves
+    assert "pass" not in sampled(policy)[0]
+
+
+def test_import_sgf_keeps_comments_and_passes(game):
+    sgf = "(;GM[1]SZ[9]KM[6.5];B[ee]C[nice move];W[cc]LB[dd:A];C[just a comment];B[];W[]C[game over])"
+    assert game.import_sgf(sgf)
+    assert game.game_ended()
+    assert (game.board_state != EMPTY).sum() == 2
+    exported = game.export_sgf({})
+    for node_sgf in [";B[ee]C[nice move]", ";W[cc]LB[dd:A]C[just a comment]", ";B[]", ";W[]C[game over]"]:
+        assert node_sgf in exported
+
+
+def test_import_sgf_comment_node_keeps_player_to_move(game):
+    assert game.import_sgf("(;SZ[9];B[ee];C[comment])")
+    assert game.player == "B" and game.next_player == "W"
+    assert game.current_node.get_property("C") == "comment"